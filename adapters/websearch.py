@@ -1,28 +1,121 @@
 # adapters/websearch.py
 import os
 import re
+import logging
 import json
 import time
 import html
 import csv
+import hashlib
+import threading
+import codecs
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
 from urllib.parse import urlparse
 from datetime import datetime
 
+try:
+    import orjson
+    _loads = orjson.loads  # 2–5× szybszy parser (JSON-LD, odpowiedzi CSE)
+except ImportError:
+    _loads = json.loads
+
 # ========== Konfiguracja ekstrakcji ceny ==========
 
+# kwantyfikatory zaborcze (*+, ?+; re od Pythona 3.11) – po nieudanym dopasowaniu silnik
+# nie próbuje innych podziałów grup cyfr, więc brak kwadratowych nawrotów na długich ciągach liczb
 PRICE_RE = re.compile(
-    r'(\d{1,5}(?:[ \xa0]?\d{3})*(?:[.,]\d{1,2})?)\s*(zł|pln|€|eur|kč|kc|czk)\b',
+    r'(\d{1,5}(?:[ \xa0]?\d{3})*+(?:[.,]\d{1,2})?+)\s*+(zł|pln|€|eur|kč|kc|czk)\b',
     re.IGNORECASE
 )
 
+# domeny "funkcjonalne", pod którymi sklepy rejestrują własne nazwy (fallback bez tldextract)
+_MULTI_LABEL_SUFFIXES = frozenset({
+    "com.pl", "net.pl", "org.pl", "info.pl", "biz.pl", "edu.pl", "gov.pl",
+    "shop.pl", "sklep.pl", "waw.pl", "krakow.pl", "wroc.pl", "poznan.pl", "gda.pl",
+    "com.de", "co.uk", "org.uk", "com.cz", "co.cz", "com.sk", "com.eu",
+})
+
+try:
+    import tldextract
+    # lista PSL dołączona do pakietu – bez pobierania z sieci i bez cache na dysku
+    _tld_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+except ImportError:
+    _tld_extract = None
+
+@lru_cache(maxsize=10_000)
+def _registered_domain(host: str) -> str:
+    if _tld_extract is not None:
+        e = _tld_extract(host)
+        return f"{e.domain}.{e.suffix}" if e.domain and e.suffix else (e.domain or host)
+    parts = host.split(".")
+    n = 3 if len(parts) >= 3 and ".".join(parts[-2:]) in _MULTI_LABEL_SUFFIXES else 2
+    return ".".join(parts[-n:])
+
 def _domain(url: str) -> str:
     try:
-        host = urlparse(url).hostname or ""
-        parts = host.split(".")
-        return ".".join(parts[-3:]) if len(parts) >= 3 and len(parts[-1]) <= 3 else ".".join(parts[-2:])
+        # hostname jest już bez portu i małymi literami; kropka FQDN ("sklep.pl.") psułaby podział
+        host = (urlparse(url).hostname or "").rstrip(".")
     except Exception:
         return ""
+    return _registered_domain(host) if host else ""
+
+# flagi inline bez zakresu, np. (?i) – w alternacji przestają stać na początku wyrażenia
+_INLINE_FLAGS_RE = re.compile(r"\(\?[aiLmsux]+\)")
+# odwołania wsteczne – w alternacji \1 wskazywałoby grupę z innego wzorca
+_BACKREF_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+@lru_cache(maxsize=32)
+def _compile_any(patterns: tuple):
+    """
+    Funkcja text -> bool: czy pasuje którykolwiek z regexów (None dla pustej listy).
+    Zwykle jedna alternacja (jedno przejście silnika zamiast N); wzorce z flagami inline
+    albo odwołaniami wstecznymi – każdy osobno przez any(), z taką semantyką jak w configu.
+    Cache po krotce wzorców – config się nie zmienia, więc kompilacja raz na proces.
+    """
+    if not patterns:
+        return None
+    if not any(_INLINE_FLAGS_RE.search(p) or _BACKREF_RE.search(p) for p in patterns):
+        try:
+            combined = re.compile("|".join(f"(?:{p})" for p in patterns))
+        except re.error:
+            pass  # np. powtórzone nazwy grup – niżej osobno (błędny wzorzec zgłosi się tam)
+        else:
+            return lambda text: combined.search(text) is not None
+    compiled = [re.compile(p) for p in patterns]
+    return lambda text: any(c.search(text) for c in compiled)
+
+try:
+    # google-re2 (opcjonalny, poza requirements): czas liniowy, bez katastrofalnych nawrotów;
+    # wzorce z configu (\b, lookahead) i tak zostają w `re` – instaluj dla własnych prostych wzorców
+    import re2
+except ImportError:
+    re2 = None
+
+# konstrukcje, które RE2 rozumie inaczej niż `re` na tekście Unicode: \b \w \s \d (i negacje)
+# znają w RE2 tylko ASCII (np. NBSP to nie \s, "ę" to nie \w), a $ nie pasuje przed końcowym \n
+_RE2_UNSAFE_RE = re.compile(r"\\[bBwWsSdD]|\$")
+
+@lru_cache(maxsize=32)
+def _compile_pattern(pat_str: str):
+    """
+    Regex produktu z configu; niepoprawny wzorzec = brak filtra.
+    Kompilowany w RE2 tylko wtedy, gdy daje te same dopasowania co `re`: wzorzec ASCII bez
+    klas \b/\w/\s/\d i bez $. Pozostałe (oraz lookaround/backref, których RE2 nie ma) – w `re`.
+    """
+    if re2 is not None and pat_str.isascii() and not _RE2_UNSAFE_RE.search(pat_str):
+        try:
+            return re2.compile(pat_str)
+        except Exception:
+            pass
+    try:
+        return re.compile(pat_str)
+    except Exception:
+        return None
 
 def _to_float(num_str: str):
     try:
@@ -30,59 +123,139 @@ def _to_float(num_str: str):
     except Exception:
         return None
 
-def _convert_to_pln(value: float, unit: str, rates: dict) -> float | None:
-    unit = (unit or "").lower()
-    if unit in ("zł", "pln"):
-        return value
-    if unit in ("€", "eur"):
-        if rates.get("parse_eur") and rates.get("eur_to_pln"):
-            return value * float(rates["eur_to_pln"])
-        return None
-    if unit in ("kč", "kc", "czk"):
-        if rates.get("parse_czk") and rates.get("czk_to_pln"):
-            return value * float(rates["czk_to_pln"])
-        return None
-    return None
+def _unit_multipliers(rates: dict) -> dict:
+    """
+    Tablica jednostka → mnożnik do PLN, liczona raz na wywołanie search().
+    Waluty wyłączone w configu (albo bez kursu) nie trafiają do tablicy.
+    """
+    eur = float(rates["eur_to_pln"]) if rates.get("parse_eur") and rates.get("eur_to_pln") else None
+    czk = float(rates["czk_to_pln"]) if rates.get("parse_czk") and rates.get("czk_to_pln") else None
+    units = {"zł": 1.0, "pln": 1.0, "€": eur, "eur": eur, "kč": czk, "kc": czk, "czk": czk}
+    return {u: m for u, m in units.items() if m is not None}
+
+def _convert_to_pln(value: float, unit: str, units: dict) -> float | None:
+    mul = units.get((unit or "").lower())
+    return value * mul if mul else None
 
 # ========== Debug CSV ==========
 
+_DBG_FIELDS = [
+    "ts","query","url","title","domain",
+    "passed_domain","passed_url_regex",
+    "fetched","matched_pattern","used_js",
+    "price_pln","filtered_out_reason"
+]
+_DBG_ROWS: list[dict] = []  # bufor wierszy; zapisywany raz na koniec search()
+
 def _dbg_write(debug_cfg: dict | None, row: dict):
-    """Dopisuje wiersz do CSV z podglądem kandydatów."""
+    """Dodaje wiersz podglądu kandydatów do bufora (zapis: _dbg_flush)."""
+    if not debug_cfg or not debug_cfg.get("dump_urls_csv"):
+        return
+    _DBG_ROWS.append({"ts": datetime.utcnow().isoformat(), **row})
+
+def _dbg_flush(debug_cfg: dict | None):
+    """Dopisuje zbuforowane wiersze do CSV jednym otwarciem pliku."""
+    if not _DBG_ROWS:
+        return
+    rows = list(_DBG_ROWS)
+    _DBG_ROWS.clear()
     if not debug_cfg or not debug_cfg.get("dump_urls_csv"):
         return
     path = debug_cfg.get("dump_file", "checked_urls.csv")
-    fields = [
-        "ts","query","url","title","domain",
-        "passed_domain","passed_url_regex",
-        "fetched","matched_pattern","used_js",
-        "price_pln","filtered_out_reason"
-    ]
     write_header = not os.path.exists(path)
     try:
         with open(path, "a", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=fields)
+            w = csv.DictWriter(f, fieldnames=_DBG_FIELDS)
             if write_header:
                 w.writeheader()
-            row = {"ts": datetime.utcnow().isoformat(), **row}
-            w.writerow(row)
+            w.writerows(rows)
     except Exception:
         # jeśli z jakiegoś powodu nie da się dopisać – pomiń (nie blokujemy wyszukiwania)
         pass
 
+# ========== Dostępność ==========
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+@lru_cache(maxsize=32)
+def _oos_matcher(words: tuple):
+    """
+    Funkcja text -> bool: czy strona zawiera któreś ze słów "brak towaru" (małe litery).
+    Z pyahocorasick wszystkie słowa są szukane jednym przejściem automatu; bez niego – jedna
+    alternacja z IGNORECASE po oryginalnym tekście (bez kopii całego HTML w .lower()).
+    """
+    if ahocorasick is not None and words:
+        automaton = ahocorasick.Automaton()
+        for w in words:
+            automaton.add_word(w, w)
+        automaton.make_automaton()
+
+        def matches(text: str) -> bool:
+            return next(automaton.iter(text.lower()), None) is not None
+        return matches
+
+    if not words:
+        return lambda text: False
+    oos_re = re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+
+    def matches(text: str) -> bool:
+        return oos_re.search(text) is not None
+    return matches
+
 # ========== Ekstrakcja ze strukturalnych danych ==========
 
-def _extract_from_jsonld(text: str, rates: dict) -> float | None:
+_JSONLD_ANCHOR = "application/ld+json"
+# typ MIME bywa pisany wielkimi literami ("application/LD+JSON") – szukamy bez rozróżniania
+_JSONLD_ANCHOR_RE = re.compile(re.escape(_JSONLD_ANCHOR), re.IGNORECASE)
+_SCRIPT_OPEN = "<script"
+_SCRIPT_CLOSE = "</script"
+_JSONLD_MAX_DEPTH = 32  # grafy schema.org nie bywają głębsze
+
+def _iter_jsonld_blocks(text: str):
+    """
+    Zwraca treść kolejnych <script type="application/ld+json">.
+    Zamiast regexu DOTALL po całym HTML: szukamy samej kotwicy typu (literał),
+    cofamy się do początku tagu <script i idziemy do najbliższego </script>.
+    """
+    m = _JSONLD_ANCHOR_RE.search(text)
+    while m is not None:
+        pos = m.start()
+        nxt = pos + len(_JSONLD_ANCHOR)
+        tag_start = text.rfind("<", 0, pos)
+        tag_end = text.find(">", pos)
+        # kotwica musi leżeć w atrybutach otwierającego <script ...>
+        if (tag_start != -1 and tag_end != -1
+                and text[tag_start:tag_start + len(_SCRIPT_OPEN)].lower() == _SCRIPT_OPEN
+                and text.find(">", tag_start, pos) == -1):
+            body_start = tag_end + 1
+            close = text.find("</", body_start)
+            while close != -1 and text[close:close + len(_SCRIPT_CLOSE)].lower() != _SCRIPT_CLOSE:
+                close = text.find("</", close + 2)
+            if close == -1:
+                return
+            yield text[body_start:close]
+            nxt = close
+        m = _JSONLD_ANCHOR_RE.search(text, nxt)
+
+def _extract_from_jsonld(text: str, units: dict) -> float | None:
     """
     Szuka <script type="application/ld+json"> i próbuje znaleźć Product/Offer z price/priceCurrency.
     Zwraca najniższą cenę w PLN (po konwersji) lub None.
     """
+    return _min_price_jsonld(_iter_jsonld_blocks(text), units)
+
+def _min_price_jsonld(blocks, units: dict) -> float | None:
+    """Najniższa cena w PLN z podanych treści bloków JSON-LD."""
     prices = []
-    for m in re.finditer(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', text, re.I | re.S):
-        block = m.group(1).strip()
+    for raw in blocks:
+        block = raw.strip()
         if not block:
             continue
         try:
-            data = json.loads(block)
+            data = _loads(block)
         except Exception:
             # niektóre sklepy sklejają kilka JSON-ów w jedno <script>; spróbuj po liniach
             chunks = []
@@ -91,84 +264,426 @@ def _extract_from_jsonld(text: str, rates: dict) -> float | None:
                 if not line:
                     continue
                 try:
-                    chunks.append(json.loads(line))
+                    chunks.append(_loads(line))
                 except Exception:
                     pass
             if not chunks:
                 continue
             data = chunks
 
-        stack = [data]
+        # (węzeł, głębokość); seen chroni przed ponownym wejściem we wspólne poddrzewa
+        stack = [(data, 0)]
+        seen = set()
         while stack:
-            node = stack.pop()
-            if isinstance(node, dict):
-                t = (node.get("@type") or node.get("type") or "").lower()
-                if "product" in t or "offer" in t or "aggregateoffer" in t:
-                    if "offers" in node:
-                        stack.append(node["offers"])
-                    else:
-                        price = node.get("price") or node.get("lowPrice") or node.get("highPrice")
-                        cur   = node.get("priceCurrency") or node.get("pricecurrency")
-                        if price:
-                            val = _to_float(str(price))
-                            if val is not None:
-                                if cur:
-                                    pln = _convert_to_pln(val, str(cur), rates)
-                                else:
-                                    pln = val  # brak waluty – traktuj jak PLN
-                                if pln is not None:
-                                    prices.append(pln)
-                for v in node.values():
-                    if isinstance(v, (dict, list)):
-                        stack.append(v)
-            elif isinstance(node, list):
-                for it in node:
-                    if isinstance(it, (dict, list)):
-                        stack.append(it)
+            node, depth = stack.pop()
+            if id(node) in seen or depth > _JSONLD_MAX_DEPTH:
+                continue
+            seen.add(id(node))
+            if type(node) is dict:
+                t = node.get("@type") or node.get("type") or ""
+                if type(t) is list:  # schema.org dopuszcza np. ["Product", "Thing"]
+                    t = " ".join(str(x) for x in t)
+                t = str(t).lower()
+                # "offers" trafi na stos razem z pozostałymi wartościami poniżej
+                if ("product" in t or "offer" in t) and "offers" not in node:
+                    price = node.get("price") or node.get("lowPrice") or node.get("highPrice")
+                    cur   = node.get("priceCurrency") or node.get("pricecurrency")
+                    if price:
+                        val = _to_float(str(price))
+                        if val is not None:
+                            if cur:
+                                pln = _convert_to_pln(val, str(cur), units)
+                            else:
+                                pln = val  # brak waluty – traktuj jak PLN
+                            if pln is not None:
+                                if pln <= 0:
+                                    # minimum i tak nie będzie dodatnie – dalszy spacer nic nie zmieni
+                                    return pln
+                                prices.append(pln)
+                stack.extend((v, depth + 1) for v in node.values() if type(v) is dict or type(v) is list)
+            elif type(node) is list:
+                stack.extend((it, depth + 1) for it in node if type(it) is dict or type(it) is list)
     return min(prices) if prices else None
 
 # ========== Ekstrakcja "statyczna" regexem ==========
 
-def _extract_price_regex(text: str, rates: dict) -> float | None:
+_PRICE_HEAD_CHARS = 20_000    # cena produktu jest zwykle w meta/okolicy <h1>
+_PRICE_MAX_CANDIDATES = 20    # strony kategorii mają dziesiątki cen – nie skanujemy wszystkich
+
+_CURRENCY_MARKERS = ("zł", "pln", "€", "eur", "kč", "kc", "czk")
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# odpowiednik PRICE_RE dla Hyperscan (UTF8+UCP: \d/\s jak w `re` na str); bez końcowego \b,
+# którego Hyperscan w trybie UCP nie obsługuje – granicę sprawdza PRICE_RE.match na trafieniu
+_PRICE_HS_PATTERN = r'\d{1,5}(?:[ \x{a0}]?\d{3})*(?:[.,]\d{1,2})?\s*(?:z[łŁ]|pln|€|eur|k[čČ]|kc|czk)'
+_UTF8_MAX_CHAR = 4  # bajty jednego znaku UTF-8 – zapas za końcem trafienia na test granicy \b
+
+def _build_price_db():
+    if hyperscan is None:
+        return None
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[_PRICE_HS_PATTERN.encode("utf-8")],
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+                   | hyperscan.HS_FLAG_SOM_LEFTMOST],
+        )
+        return db
+    except hyperscan.error as e:
+        logging.warning(f"Hyperscan: nie udało się skompilować wzorca ceny ({e}) – używam re")
+        return None
+
+_PRICE_HS_DB = _build_price_db()
+
+def _price_matches(text: str, units: dict):
+    """
+    Pary (liczba, mnożnik do PLN) dla cen w obsługiwanych walutach, najwyżej
+    _PRICE_MAX_CANDIDATES. Z Hyperscanem cały tekst jest skanowany jednym przejściem DFA
+    bez nawrotów, a PRICE_RE dzieli na grupy (i sprawdza granicę słowa) tylko krótkie
+    trafienia; bez niego – zwykłe PRICE_RE.finditer.
+    """
+    get_mul = units.get
+    if _PRICE_HS_DB is None:
+        found = 0
+        for m in PRICE_RE.finditer(text):
+            mul = get_mul(m.group(2).lower())
+            if not mul:
+                continue
+            yield m.group(1), mul
+            found += 1
+            if found >= _PRICE_MAX_CANDIDATES:
+                return
+        return
+
+    # render z Playwrighta może nieść samotny surogat z JS (np. "\ud800"); zamiana na "?"
+    # zamiast surrogatepass, bo Hyperscan w trybie UTF8 wymaga poprawnego UTF-8 na wejściu
+    buf = text.encode("utf-8", errors="replace")
+    hits = []
+    capped = False
+
+    def on_match(_id, start, end, _flags, _ctx):
+        # jeden znak za trafieniem, żeby PRICE_RE mógł sprawdzić \b jak przy skanie `re`
+        m = PRICE_RE.match(buf[start:end + _UTF8_MAX_CHAR].decode("utf-8", errors="ignore"))
+        if m:
+            mul = get_mul(m.group(2).lower())
+            if mul:
+                hits.append((m.group(1), mul))
+        if len(hits) >= _PRICE_MAX_CANDIDATES:
+            nonlocal capped
+            capped = True
+            return True  # przerywa skan
+        return False
+
+    try:
+        _PRICE_HS_DB.scan(buf, match_event_handler=on_match)
+    except hyperscan.error:
+        if not capped:
+            raise  # prawdziwy błąd skanu, a nie przerwanie po limicie kandydatów
+    yield from hits
+
+def _min_price_regex(text: str, units: dict) -> float | None:
+    # tani test podciągów zanim puścimy regex z nawrotami po całym tekście
+    low = text.lower()
+    if not any(m in low for m in _CURRENCY_MARKERS):
+        return None
+    # bieżące minimum zamiast listy + min(); waluty i limit kandydatów filtruje _price_matches
+    best = None
+    for num, mul in _price_matches(text, units):
+        val = _to_float(num)
+        if val is None:
+            continue
+        pln = val * mul
+        if best is None or pln < best:
+            best = pln
+    return best
+
+def _extract_price_regex(text: str, units: dict) -> float | None:
+    """Najpierw początek dokumentu; reszta strony tylko gdy tam nie ma żadnej ceny."""
+    price = _min_price_regex(text[:_PRICE_HEAD_CHARS], units)
+    if price is None and len(text) > _PRICE_HEAD_CHARS:
+        # mała zakładka, żeby nie zgubić ceny przeciętej granicą okna
+        price = _min_price_regex(text[_PRICE_HEAD_CHARS - 64:], units)
+    return price
+
+# ========== Ekstrakcja parserem HTML (selectolax) ==========
+
+try:
+    # backend lexbor (selectolax.parser/Modest jest w selectolax 1.0 wycofany i rzuca ImportError)
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+
+_JSONLD_CSS = 'script[type="application/ld+json"]'
+_PRICE_CSS = '[itemprop="price"], meta[property$="price:amount"]'
+_CURRENCY_CSS = '[itemprop="priceCurrency"], meta[property$="price:currency"]'
+
+def _node_value(node) -> str:
+    return (node.attributes.get("content") or node.text() or "").strip()
+
+def _extract_prices_html(text: str, units: dict) -> float | None:
+    """
+    Cena z drzewa HTML: bloki JSON-LD wybrane selektorem CSS, potem znaczniki
+    itemprop=price / og:price:amount. None, gdy strona nie ma danych strukturalnych.
+    """
+    tree = HTMLParser(text)
+    price = _min_price_jsonld((n.text() for n in tree.css(_JSONLD_CSS)), units)
+    if price:
+        return price
+
+    cur_node = tree.css_first(_CURRENCY_CSS)
+    cur = _node_value(cur_node) if cur_node is not None else ""
     candidates = []
-    for m in PRICE_RE.finditer(text):
-        val = _to_float(m.group(1))
+    for n in tree.css(_PRICE_CSS):
+        val = _to_float(_node_value(n))
         if val is None:
             continue
-        unit = m.group(2)
-        pln = _convert_to_pln(val, unit, rates)
+        pln = _convert_to_pln(val, cur, units) if cur else val  # brak waluty – traktuj jak PLN
         if pln is not None:
             candidates.append(pln)
     return min(candidates) if candidates else None
 
-# ========== Playwright fallback (render JS) ==========
+def _extract_price(text: str, units: dict) -> float | None:
+    """Cena strony: dane strukturalne (selectolax albo skan JSON-LD), a na końcu regex po treści."""
+    if HTMLParser is not None:
+        return _extract_prices_html(text, units) or _extract_price_regex(text, units)
+    return _extract_from_jsonld(text, units) or _extract_price_regex(text, units)
 
-_RENDER_COUNT = 0  # prosty licznik na przebieg
+# ========== Playwright fallback (render JS) ==========
 
-def _render_and_get_html(url: str, nav_timeout_ms: int, wait_until: str) -> str | None:
+class _Renderer:
     """
-    Renderuje stronę w headless Chromium i zwraca HTML po załadowaniu.
+    Headless Chromium współdzielony przez wszystkie rendery jednego wywołania search().
+    Playwright, przeglądarka i kontekst startują leniwie przy pierwszym renderze i są
+    zamykane w search() (close) – w tym samym wątku, bo sync API Playwrighta odmawia
+    wywołań z innych wątków (APScheduler puszcza kolejne przebiegi w różnych wątkach).
     Wymaga: playwright + zainstalowanego chromium (workflow: playwright install --with-deps chromium).
     """
-    try:
-        from playwright.sync_api import sync_playwright
-    except Exception:
-        return None
 
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            ctx = browser.new_context(locale="pl-PL", user_agent="Mozilla/5.0")
-            page = ctx.new_page()
+    def __init__(self):
+        self.count = 0  # prosty licznik renderów na przebieg
+        self._pw = None
+        self._browser = None
+        self._ctx = None
+
+    def _start(self) -> bool:
+        try:
+            from playwright.sync_api import sync_playwright
+        except Exception:
+            return False
+        try:
+            self._pw = sync_playwright().start()
+            self._browser = self._pw.chromium.launch(headless=True)
+            self._ctx = self._browser.new_context(locale="pl-PL", user_agent="Mozilla/5.0")
+        except Exception:
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        """Zamyka kontekst, przeglądarkę i Playwright (no-op, jeśli nic nie wystartowało)."""
+        for obj in (self._ctx, self._browser):
+            try:
+                if obj is not None:
+                    obj.close()
+            except Exception:
+                pass
+        try:
+            if self._pw is not None:
+                self._pw.stop()
+        except Exception:
+            pass
+        self._pw = self._browser = self._ctx = None
+
+    def render(self, url: str, nav_timeout_ms: int, wait_until: str) -> str | None:
+        """Renderuje stronę i zwraca HTML po załadowaniu (None przy błędzie)."""
+        if self._ctx is None and not self._start():
+            return None
+
+        page = None
+        try:
+            page = self._ctx.new_page()
             page.set_default_navigation_timeout(nav_timeout_ms)
             page.goto(url, wait_until=wait_until)
             page.wait_for_timeout(500)
-            content = page.content()
-            browser.close()
-            return content
+            return page.content()
+        except Exception:
+            return None
+        finally:
+            if page is not None:
+                try:
+                    page.close()
+                except Exception:
+                    pass
+
+_RENDERER = _Renderer()
+
+# ========== Cache renderów na dysku ==========
+
+_RENDER_CACHE_DIR = Path(__file__).resolve().parent.parent / ".render_cache"
+_RENDER_CACHE_MAX_FILES = 200  # górny limit wpisów; najstarsze są usuwane przy zapisie
+
+def _render_cache_path(url: str) -> Path:
+    return _RENDER_CACHE_DIR / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+def _render_cache_get(url: str, ttl_s: float) -> str | None:
+    """Zwraca HTML wyrenderowany w poprzednich przebiegach, jeśli jest młodszy niż ttl_s."""
+    if ttl_s <= 0:
+        return None
+    path = _render_cache_path(url)
+    try:
+        if time.time() - path.stat().st_mtime > ttl_s:
+            return None
+        return path.read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+def _render_cache_prune(ttl_s: float):
+    """Usuwa rendery starsze niż ttl_s, a z pozostałych zostawia _RENDER_CACHE_MAX_FILES najnowszych."""
+    now = time.time()
+    entries = []
+    for path in _RENDER_CACHE_DIR.iterdir():
+        try:
+            mtime = path.stat().st_mtime
+            if now - mtime > ttl_s:
+                path.unlink()
+            else:
+                entries.append((mtime, path))
+        except OSError:
+            pass
+    entries.sort(reverse=True)
+    # jedno miejsce zostaje na zapisywany właśnie render
+    for _, path in entries[_RENDER_CACHE_MAX_FILES - 1:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+def _render_cache_put(url: str, content: str, ttl_s: float):
+    """
+    Zapisuje render atomowo (plik tymczasowy + os.replace) i sprząta przeterminowane wpisy;
+    błędy zapisu pomijamy.
+    """
+    path = _render_cache_path(url)
+    tmp = path.with_suffix(".tmp")
+    try:
+        _RENDER_CACHE_DIR.mkdir(exist_ok=True)
+        _render_cache_prune(ttl_s)
+        tmp.write_text(content, encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+# ========== Sesja HTTP ==========
+
+_FETCH_WORKERS = 8  # równoległe pobrania wyników CSE
+
+def _new_session() -> requests.Session:
+    """
+    Sesja z pulą połączeń dopasowaną do równoległych pobrań (domyślnie 10 na host).
+    Kompresja: requests wysyła "Accept-Encoding: gzip, deflate" + "br", gdy zainstalowany
+    jest pakiet brotli (urllib3 sam go wykrywa i dekoduje odpowiedzi).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2 * _FETCH_WORKERS, pool_maxsize=2 * _FETCH_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# ========== Pobieranie statycznego HTML ==========
+
+_MAX_BODY_BYTES = 256_000  # <head> + JSON-LD + cena "nad zgięciem" mieszczą się z zapasem
+_CHUNK_BYTES = 16 * 1024
+_STOP_OVERLAP = 64         # zakładka między kawałkami, żeby nie przeciąć szukanego słowa
+
+# rewalidacja stron między przebiegami schedulera: url -> (ETag, Last-Modified, przycięty tekst)
+_PAGE_CACHE_MAX = 200
+_PAGE_CACHE: OrderedDict = OrderedDict()
+_PAGE_CACHE_LOCK = threading.Lock()  # _fetch_html działa w puli wątków
+
+def _page_cache_get(url: str):
+    with _PAGE_CACHE_LOCK:
+        entry = _PAGE_CACHE.get(url)
+        if entry is not None:
+            _PAGE_CACHE.move_to_end(url)
+        return entry
+
+def _page_cache_put(url: str, etag: str | None, last_modified: str | None, text: str):
+    with _PAGE_CACHE_LOCK:
+        _PAGE_CACHE[url] = (etag, last_modified, text)
+        _PAGE_CACHE.move_to_end(url)
+        while len(_PAGE_CACHE) > _PAGE_CACHE_MAX:
+            _PAGE_CACHE.popitem(last=False)
+
+def _fetch_html(session: requests.Session, url: str, headers: dict, timeout: int,
+                stop=None) -> str | None:
+    """
+    Pobiera początek strony (max _MAX_BODY_BYTES) strumieniowo i zwraca go jako tekst;
+    None przy błędzie sieci. `stop(text) -> bool` sprawdzany po każdym kawałku pozwala
+    przerwać pobieranie wcześniej (np. strona i tak zostanie odrzucona jako niedostępna).
+    Strona pobrana wcześniej z ETag/Last-Modified jest pytana warunkowo
+    (If-None-Match/If-Modified-Since); przy 304 wraca zapamiętany tekst.
+    """
+    cached = _page_cache_get(url)
+    if cached is not None:
+        etag, last_modified, _ = cached
+        headers = dict(headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    try:
+        pr = session.get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            if pr.status_code == 304 and cached is not None:
+                return cached[2]
+            try:
+                decoder = codecs.getincrementaldecoder(pr.encoding or "utf-8")(errors="replace")
+            except LookupError:  # nieznana nazwa kodowania w nagłówku
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            parts = []
+            size = 0
+            tail = ""
+            stopped = False
+            for chunk in pr.iter_content(chunk_size=_CHUNK_BYTES):
+                chunk = chunk[:_MAX_BODY_BYTES - size]
+                size += len(chunk)
+                piece = decoder.decode(chunk)
+                parts.append(piece)
+                if size >= _MAX_BODY_BYTES:
+                    break
+                if stop is not None and stop(tail + piece):
+                    stopped = True
+                    break
+                tail = piece[-_STOP_OVERLAP:]
+            parts.append(decoder.decode(b"", final=True))
+            text = "".join(parts)
+            # zapamiętujemy tylko pełny (do limitu) odczyt – urwany przez stop() nie zastąpi strony
+            etag = pr.headers.get("ETag")
+            last_modified = pr.headers.get("Last-Modified")
+            if pr.status_code == 200 and not stopped and (etag or last_modified):
+                _page_cache_put(url, etag, last_modified, text)
+            return text
+        finally:
+            pr.close()
     except Exception:
         return None
 
+# ========== Google CSE ==========
+
+CSE_URL = "https://www.googleapis.com/customsearch/v1"
+_CSE_WORKERS = 4
+_CSE_MAX_START = 91  # CSE zwraca najwyżej 100 wyników (start + num <= 101)
+
+def _cse_page(session: requests.Session, params: dict, start: int, timeout: int) -> list:
+    """Jedna strona wyników CSE (10 pozycji) zaczynająca się od `start`."""
+    r = session.get(CSE_URL, params={**params, "start": start}, timeout=timeout)
+    r.raise_for_status()
+    return _loads(r.content).get("items", []) or []
+
 # ========== Główne wyszukiwanie ==========
 
 def search(term: str, timeout: int = 10, ctx: dict | None = None):
@@ -182,9 +697,19 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
       - require_in_stock: bool
       - pattern: regex tytułu/HTML (dopasowanie PRODUKTU)
       - currency: { parse_eur, parse_czk, eur_to_pln, czk_to_pln }
-      - rendering: { enable_js, max_js_pages_per_run, nav_timeout_ms, wait_until, js_domains_whitelist }
+      - rendering: { enable_js, max_js_pages_per_run, nav_timeout_ms, wait_until, js_domains_whitelist,
+                     cache_ttl_hours }
       - debug: { dump_urls_csv, dump_file }
     """
+    debug_cfg = (ctx or {}).get("debug", {}) or {}
+    try:
+        return _search_cse(term, timeout, ctx, debug_cfg)
+    finally:
+        _dbg_flush(debug_cfg)
+        # przeglądarka zamykana w wątku, który ją uruchomił
+        _RENDERER.close()
+
+def _search_cse(term: str, timeout: int, ctx: dict | None, debug_cfg: dict) -> list:
     key = os.getenv("GOOGLE_CSE_KEY")
     cx  = os.getenv("GOOGLE_CSE_CX")
     if not key or not cx:
@@ -192,37 +717,38 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
 
     ws = (ctx or {}).get("websearch", {}) or {}
     max_results = int(ws.get("max_results", 10))
-    whitelist = set((ws.get("site_whitelist") or []))
-    blacklist = set((ws.get("site_blacklist") or []))
-    url_wl_patterns = [re.compile(p) for p in (ws.get("url_whitelist_patterns") or [])]
-    url_bl_patterns = [re.compile(p) for p in (ws.get("url_blacklist_patterns") or [])]
+    # krotki sufiksów: str.endswith(tuple) sprawdza wszystkie w jednym wywołaniu (w C)
+    whitelist = tuple(set(ws.get("site_whitelist") or []))
+    blacklist = tuple(set(ws.get("site_blacklist") or []))
+    url_wl_match = _compile_any(tuple(ws.get("url_whitelist_patterns") or ()))
+    url_bl_match = _compile_any(tuple(ws.get("url_blacklist_patterns") or ()))
     exact_phrase = bool(ws.get("exact_phrase", False))
     prefer_pl    = bool(ws.get("prefer_country_pl", True))
 
-    out_words = [w.lower() for w in (ctx or {}).get("availability_keywords", {}).get("out_of_stock", [])]
+    out_words = tuple(w.lower() for w in (ctx or {}).get("availability_keywords", {}).get("out_of_stock", []))
+    is_out_of_stock = _oos_matcher(out_words)
     require_in_stock = bool((ctx or {}).get("require_in_stock", False))
+    # strony z markerem niedostępności i tak odrzucamy – nie ma sensu ich dociągać do końca
+    stop_fetch = is_out_of_stock if require_in_stock and out_words else None
     rates = (ctx or {}).get("currency", {})  # kursy walut
+    units = _unit_multipliers(rates)
 
     rend = (ctx or {}).get("rendering", {}) or {}
     enable_js = bool(rend.get("enable_js", False))
     max_js = int(rend.get("max_js_pages_per_run", 0))
     nav_timeout_ms = int(rend.get("nav_timeout_ms", 12000))
     wait_until = str(rend.get("wait_until", "networkidle"))
-    js_domains_wl = set((rend.get("js_domains_whitelist") or []))
-
-    debug_cfg = (ctx or {}).get("debug", {}) or {}
+    js_domains_wl = tuple(set(rend.get("js_domains_whitelist") or []))
+    render_cache_ttl = float(rend.get("cache_ttl_hours", 6)) * 3600
 
     # regex produktu (sprawdzamy tytuł, a jeśli nie pasuje—treść HTML)
-    pat = None
+    # kompilacja raz na proces (lru_cache w _compile_pattern; RE2, gdy bezpieczne)
     pat_str = (ctx or {}).get("pattern")
-    if pat_str:
-        try:
-            pat = re.compile(pat_str)
-        except Exception:
-            pat = None
+    pat = _compile_pattern(pat_str) if pat_str else None
+    pat_search = pat.search if pat else None  # metoda związana raz, nie przy każdym wywołaniu
 
     items = []
-    session = requests.Session()
+    session = _new_session()
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Accept-Language": "pl-PL,pl;q=0.9",
@@ -247,28 +773,44 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
 
     fetched = 0
     start = 1
-    global _RENDER_COUNT
-
-    while fetched < max_results:
-        params["start"] = start
-        r = session.get("https://www.googleapis.com/customsearch/v1", params=params, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        results = data.get("items", []) or []
-        if not results:
+    seen = set()
+
+    while fetched < max_results and start <= _CSE_MAX_START:
+        # strony CSE potrzebne do uzbierania brakujących wyników – pobierane równolegle
+        n_pages = -(-(max_results - fetched) // 10)
+        starts = list(range(start, min(start + 10 * n_pages, _CSE_MAX_START + 1), 10))
+        with ThreadPoolExecutor(max_workers=min(len(starts), _CSE_WORKERS)) as pool:
+            pages = list(pool.map(lambda s: _cse_page(session, params, s, timeout), starts))
+        start = starts[-1] + 10
+
+        results = []
+        exhausted = False
+        for page_items in pages:
+            if not page_items:
+                exhausted = True
+                break
+            results.extend(page_items)
+        if exhausted:
             _dbg_write(debug_cfg, {
                 "query": term, "url": "", "title": "", "domain": "",
                 "passed_domain": "", "passed_url_regex": "",
                 "fetched": 0, "matched_pattern": "", "used_js": 0,
                 "price_pln": "", "filtered_out_reason": "cse_no_results"
             })
-            break
+            if not results:
+                break
 
+        # 1-2) filtry domen i ścieżek (bez sieci) – zbieramy kandydatów do pobrania
+        candidates = []
         for it in results:
             link = it.get("link") or ""
             title = it.get("title") or ""
             if not link:
                 continue
+            # deduplikacja po URL jeszcze przed pobraniem strony
+            if link in seen:
+                continue
+            seen.add(link)
             dom = _domain(link)
 
             # listed (surowy kandydat z CSE)
@@ -280,7 +822,7 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
             })
 
             # 1) filtr domen
-            if whitelist and all(not dom.endswith(w) for w in whitelist):
+            if whitelist and not dom.endswith(whitelist):
                 _dbg_write(debug_cfg, {
                     "query": term, "url": link, "title": title, "domain": dom,
                     "passed_domain": 0, "passed_url_regex": "", "fetched": 0,
@@ -288,7 +830,7 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
                     "filtered_out_reason": "domain_not_whitelisted"
                 })
                 continue
-            if blacklist and any(dom.endswith(b) for b in blacklist):
+            if blacklist and dom.endswith(blacklist):
                 _dbg_write(debug_cfg, {
                     "query": term, "url": link, "title": title, "domain": dom,
                     "passed_domain": 0, "passed_url_regex": "", "fetched": 0,
@@ -298,7 +840,7 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
                 continue
 
             # 2) filtr po ścieżce
-            if url_wl_patterns and not any(p.search(link) for p in url_wl_patterns):
+            if url_wl_match and not url_wl_match(link):
                 _dbg_write(debug_cfg, {
                     "query": term, "url": link, "title": title, "domain": dom,
                     "passed_domain": 1, "passed_url_regex": 0, "fetched": 0,
@@ -306,7 +848,7 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
                     "filtered_out_reason": "url_not_whitelisted"
                 })
                 continue
-            if url_bl_patterns and any(p.search(link) for p in url_bl_patterns):
+            if url_bl_match and url_bl_match(link):
                 _dbg_write(debug_cfg, {
                     "query": term, "url": link, "title": title, "domain": dom,
                     "passed_domain": 1, "passed_url_regex": 0, "fetched": 0,
@@ -315,111 +857,127 @@ def search(term: str, timeout: int = 10, ctx: dict | None = None):
                 })
                 continue
 
-            # 3) pobierz statyczny HTML
-            try:
-                pr = session.get(link, headers=headers, timeout=timeout)
-                html_text = pr.text
-                _dbg_write(debug_cfg, {
-                    "query": term, "url": link, "title": title, "domain": dom,
-                    "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
-                    "matched_pattern": "", "used_js": 0, "price_pln": "",
-                    "filtered_out_reason": "fetched"
-                })
-            except Exception:
-                _dbg_write(debug_cfg, {
-                    "query": term, "url": link, "title": title, "domain": dom,
-                    "passed_domain": 1, "passed_url_regex": 1, "fetched": 0,
-                    "matched_pattern": "", "used_js": 0, "price_pln": "",
-                    "filtered_out_reason": "fetch_error"
-                })
-                continue
-
-            # 4) pattern na tytule/HTML (wstępnie)
-            matched = True
-            if pat:
-                matched = bool(pat.search(title)) or bool(pat.search(html_text))
-                if not matched:
-                    _dbg_write(debug_cfg, {
-                        "query": term, "url": link, "title": title, "domain": dom,
-                        "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
-                        "matched_pattern": 0, "used_js": 0, "price_pln": "",
-                        "filtered_out_reason": "pattern_no_match_yet"
-                    })
-                    # nie odrzucamy jeszcze – spróbujemy JSON-LD/JS
-
-            # 5) dostępność
-            if require_in_stock and out_words:
-                low = html_text.lower()
-                if any(w in low for w in out_words):
+            candidates.append((link, title, dom))
+
+        # 3) pobierz statyczny HTML – równolegle w puli wątków, oknami nie większymi niż liczba
+        #    brakujących wyników (bez pobierania stron, których i tak nie przetworzymy);
+        #    ekstrakcja, render i zapis debug zostają w głównym wątku
+        with ThreadPoolExecutor(max_workers=_FETCH_WORKERS) as pool:
+            pos = 0
+            while pos < len(candidates) and fetched < max_results:
+                window = candidates[pos:pos + min(_FETCH_WORKERS, max_results - fetched)]
+                pos += len(window)
+                pages = pool.map(lambda c: _fetch_html(session, c[0], headers, timeout, stop_fetch), window)
+                for (link, title, dom), html_text in zip(window, pages):
+                    if html_text is None:
+                        _dbg_write(debug_cfg, {
+                            "query": term, "url": link, "title": title, "domain": dom,
+                            "passed_domain": 1, "passed_url_regex": 1, "fetched": 0,
+                            "matched_pattern": "", "used_js": 0, "price_pln": "",
+                            "filtered_out_reason": "fetch_error"
+                        })
+                        continue
                     _dbg_write(debug_cfg, {
                         "query": term, "url": link, "title": title, "domain": dom,
                         "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
-                        "matched_pattern": int(matched), "used_js": 0, "price_pln": "",
-                        "filtered_out_reason": "out_of_stock_marker"
+                        "matched_pattern": "", "used_js": 0, "price_pln": "",
+                        "filtered_out_reason": "fetched"
                     })
-                    continue
 
-            # 6) cena: JSON-LD → regex
-            price = _extract_from_jsonld(html_text, rates) or _extract_price_regex(html_text, rates)
-
-            # 7) jeśli brak ceny, a JS włączony – spróbuj renderu (z limitem)
-            used_js = 0
-            rendered = None
-            if price is None and enable_js:
-                if (not js_domains_wl) or any(dom.endswith(w) for w in js_domains_wl):
-                    if _RENDER_COUNT < max_js:
-                        rendered = _render_and_get_html(link, nav_timeout_ms, wait_until)
-                        _RENDER_COUNT += 1
+                    # 4) pattern na tytule/HTML (wstępnie; tytuł z CSE wystarcza, HTML tylko gdy nie pasuje)
+                    can_render = enable_js and ((not js_domains_wl) or dom.endswith(js_domains_wl))
+                    matched = True
+                    if pat:
+                        matched = bool(pat_search(title)) or bool(pat_search(html_text))
+                        if not matched and not can_render:
+                            # render nie wchodzi w grę, więc nic już nie zmieni wyniku –
+                            # odrzucamy bez sprawdzania dostępności i ekstrakcji ceny
+                            _dbg_write(debug_cfg, {
+                                "query": term, "url": link, "title": title, "domain": dom,
+                                "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
+                                "matched_pattern": 0, "used_js": 0, "price_pln": "",
+                                "filtered_out_reason": "pattern_final_no_match"
+                            })
+                            continue
+                        if not matched:
+                            _dbg_write(debug_cfg, {
+                                "query": term, "url": link, "title": title, "domain": dom,
+                                "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
+                                "matched_pattern": 0, "used_js": 0, "price_pln": "",
+                                "filtered_out_reason": "pattern_no_match_yet"
+                            })
+                            # nie odrzucamy jeszcze – spróbujemy JSON-LD/JS
+
+                    # 5) dostępność
+                    if require_in_stock and out_words:
+                        if is_out_of_stock(html_text):
+                            _dbg_write(debug_cfg, {
+                                "query": term, "url": link, "title": title, "domain": dom,
+                                "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
+                                "matched_pattern": int(matched), "used_js": 0, "price_pln": "",
+                                "filtered_out_reason": "out_of_stock_marker"
+                            })
+                            continue
+
+                    # 6) cena: dane strukturalne (JSON-LD, itemprop/og:price) → regex
+                    price = _extract_price(html_text, units)
+
+                    # 7) jeśli brak ceny, a JS włączony – spróbuj renderu (z limitem;
+                    #    strony z cache renderów nie zużywają limitu)
+                    used_js = 0
+                    rendered = None
+                    if price is None and can_render:
+                        rendered = _render_cache_get(link, render_cache_ttl)
+                        if rendered is None and _RENDERER.count < max_js:
+                            rendered = _RENDERER.render(link, nav_timeout_ms, wait_until)
+                            _RENDERER.count += 1
+                            if rendered and render_cache_ttl:
+                                _render_cache_put(link, rendered, render_cache_ttl)
                         if rendered:
                             used_js = 1
                             # pattern po renderze
                             if pat and not matched:
-                                matched = bool(pat.search(title)) or bool(pat.search(rendered))
+                                matched = bool(pat_search(rendered))
                             # dostępność po renderze
                             if require_in_stock and out_words:
-                                low2 = rendered.lower()
-                                if any(w in low2 for w in out_words):
+                                if is_out_of_stock(rendered):
                                     price = None
                                 else:
-                                    price = _extract_from_jsonld(rendered, rates) or _extract_price_regex(rendered, rates)
+                                    price = _extract_price(rendered, units)
                             else:
-                                price = _extract_from_jsonld(rendered, rates) or _extract_price_regex(rendered, rates)
-
-            # 8) jeśli pattern finalnie nie pasuje – odrzuć
-            if pat and not matched:
-                _dbg_write(debug_cfg, {
-                    "query": term, "url": link, "title": title, "domain": dom,
-                    "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
-                    "matched_pattern": 0, "used_js": used_js, "price_pln": price or "",
-                    "filtered_out_reason": "pattern_final_no_match"
-                })
-                continue
-
-            # 9) zaakceptowany wynik
-            _dbg_write(debug_cfg, {
-                "query": term, "url": link, "title": title, "domain": dom,
-                "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
-                "matched_pattern": 1 if (not pat or matched) else 0,
-                "used_js": used_js, "price_pln": price if price is not None else "",
-                "filtered_out_reason": "accepted"
-            })
+                                price = _extract_price(rendered, units)
+
+                    # 8) jeśli pattern finalnie nie pasuje – odrzuć
+                    if pat and not matched:
+                        _dbg_write(debug_cfg, {
+                            "query": term, "url": link, "title": title, "domain": dom,
+                            "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
+                            "matched_pattern": 0, "used_js": used_js, "price_pln": price or "",
+                            "filtered_out_reason": "pattern_final_no_match"
+                        })
+                        continue
+
+                    # 9) zaakceptowany wynik
+                    _dbg_write(debug_cfg, {
+                        "query": term, "url": link, "title": title, "domain": dom,
+                        "passed_domain": 1, "passed_url_regex": 1, "fetched": 1,
+                        "matched_pattern": 1 if (not pat or matched) else 0,
+                        "used_js": used_js, "price_pln": price if price is not None else "",
+                        "filtered_out_reason": "accepted"
+                    })
 
-            items.append({
-                "store": "web",
-                "title": html.unescape(title),
-                "url": link,
-                "price_pln": price
-            })
+                    items.append({
+                        "store": "web",
+                        "title": html.unescape(title) if "&" in title else title,
+                        "url": link,
+                        "price_pln": price
+                    })
 
-            fetched += 1
-            if fetched >= max_results:
-                break
+                    fetched += 1
+                    if fetched >= max_results:
+                        break
 
-        start += 10
-        time.sleep(1.0)
+        if exhausted:
+            break
 
-    # deduplikacja po URL
-    uniq = {}
-    for o in items:
-        uniq[o["url"]] = o
-    return list(uniq.values())
+    return items
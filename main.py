@@ -1,11 +1,13 @@
 import os
 import csv
+import heapq
 import sqlite3
 import time
 import re
 import yaml
 import logging
 from pathlib import Path
+from contextlib import closing
 from importlib import import_module
 from datetime import datetime, timezone
 
@@ -18,6 +20,8 @@ BASE = Path(__file__).parent
 DB_PATH = BASE / "offers.db"
 CSV_PATH = BASE / "found.csv"
 
+NUM_RE = re.compile(r"(\d+(?:\.\d{1,2})?)")
+
 def ensure_db():
     con = sqlite3.connect(DB_PATH)
     cur = con.cursor()
@@ -32,9 +36,17 @@ def ensure_db():
             UNIQUE(store, url, price_pln, found_at)
         )
     """)
+    # WAL jest trwały dla pliku bazy – wystarczy ustawić raz
+    cur.execute("PRAGMA journal_mode=WAL")
     con.commit()
     con.close()
 
+def connect_db():
+    con = sqlite3.connect(DB_PATH)
+    # w trybie WAL NORMAL nie traci spójności, a oszczędza fsync przy każdym commit
+    con.execute("PRAGMA synchronous=NORMAL")
+    return con
+
 def load_config():
     with open(BASE / "config.yaml", "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
@@ -43,7 +55,7 @@ def normalize_price(p):
     if p is None:
         return None
     s = str(p).replace("\xa0", " ").replace(",", ".")
-    m = re.search(r"(\d+(?:\.\d{1,2})?)", s)
+    m = NUM_RE.search(s)
     return float(m.group(1)) if m else None
 
 def run_once(cfg):
@@ -61,121 +73,119 @@ def run_once(cfg):
         "debug": cfg.get("debug", {}),            # <-- DODAĆ
     }
 
-    # nagłówek CSV jeśli plik jeszcze nie istnieje
-    if not CSV_PATH.exists():
-        with open(CSV_PATH, "w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(["product", "store", "title", "price_pln", "url", "found_at"])
-
-    for p in products:
-        name = p["name"]
-        max_price = p["max_price_pln"]
-        stores = p.get("stores", [])
-        pattern = p.get("pattern")  # regex per produkt
-
-        logging.info(f"Sprawdzam: {name} (<= {max_price} PLN) w {stores}")
-
-        for store in stores:
-            try:
-                mod = import_module(f"adapters.{store}")
-            except ModuleNotFoundError:
-                logging.warning(f"Brak adaptera sklepu: {store}")
-                continue
-
-            try:
-                # przekazujemy ctx z patternem (jeśli jest)
-                ctx = dict(ctx_global)
-                if pattern:
-                    ctx["pattern"] = pattern
-                # NOWY podpis: adapter może (ale nie musi) przyjąć ctx=
-                offers = mod.search(
-                    name,
-                    timeout=cfg.get("politeness", {}).get("request_timeout_seconds", 10),
-                    ctx=ctx
-                )
-            except TypeError:
-                # starsze adaptery bez ctx – fallback
-                offers = mod.search(
-                    name,
-                    timeout=cfg.get("politeness", {}).get("request_timeout_seconds", 10)
-                )
-            except Exception as e:
-                logging.exception(f"Błąd pobierania z {store}: {e}")
-                offers = []
-
-            # PODGLĄD: pierwsze 5 surowych wyników z adaptera
-            if offers:
-                logging.info("Podgląd pierwszych wyników (%s):", min(5, len(offers)))
-                for i, o in enumerate(offers[:5], start=1):
-                    logging.info("  [%d] %s — raw_price=%r — %s",
-                                 i, o.get("title"), o.get("price_pln"), o.get("url"))
-            else:
-                logging.info("Brak wyników z adaptera %s dla zapytania: %r", store, name)
-
-            # zapis do DB (tylko po zparsowaniu liczby)
-            con = sqlite3.connect(DB_PATH)
-            cur = con.cursor()
-            for o in offers:
-                price = normalize_price(o.get("price_pln"))
-                if price is None:
+    # jedno połączenie z bazą i jeden (buforowany) plik CSV na cały przebieg
+    write_header = not CSV_PATH.exists()
+    with closing(connect_db()) as con, \
+            open(CSV_PATH, "a", newline="", encoding="utf-8", buffering=1 << 16) as csv_file:
+        csv_out = csv.writer(csv_file)
+        # nagłówek CSV jeśli plik jeszcze nie istnieje
+        if write_header:
+            csv_out.writerow(["product", "store", "title", "price_pln", "url", "found_at"])
+
+        for p in products:
+            name = p["name"]
+            max_price = p["max_price_pln"]
+            stores = p.get("stores", [])
+            pattern = p.get("pattern")  # regex per produkt
+            if pattern is not None:
+                pattern = str(pattern)  # YAML może dać liczbę (np. pattern: 5293)
+
+            logging.info(f"Sprawdzam: {name} (<= {max_price} PLN) w {stores}")
+
+            for store in stores:
+                try:
+                    mod = import_module(f"adapters.{store}")
+                except ModuleNotFoundError:
+                    logging.warning(f"Brak adaptera sklepu: {store}")
                     continue
-                row = (o.get("store"), o.get("title"), o.get("url"), price, datetime.now(timezone.utc).isoformat())
+
                 try:
-                    cur.execute(
-                        "INSERT OR IGNORE INTO offers(store,title,url,price_pln,found_at) VALUES (?,?,?,?,?)",
-                        row
+                    # przekazujemy ctx z patternem (jeśli jest)
+                    ctx = dict(ctx_global)
+                    if pattern:
+                        ctx["pattern"] = pattern
+                    # NOWY podpis: adapter może (ale nie musi) przyjąć ctx=
+                    offers = mod.search(
+                        name,
+                        timeout=cfg.get("politeness", {}).get("request_timeout_seconds", 10),
+                        ctx=ctx
+                    )
+                except TypeError:
+                    # starsze adaptery bez ctx – fallback
+                    offers = mod.search(
+                        name,
+                        timeout=cfg.get("politeness", {}).get("request_timeout_seconds", 10)
                     )
                 except Exception as e:
-                    logging.debug(f"Insert ignore failed: {e}")
-            con.commit()
-            con.close()
-
-            # STATYSTYKI
-            priced = [o for o in offers if normalize_price(o.get("price_pln")) is not None]
-            logging.info(
-                "Statystyki: %d wyników ogółem, %d z ceną, %d ≤ %.2f PLN",
-                len(offers), len(priced),
-                sum(1 for o in priced if normalize_price(o.get("price_pln")) <= max_price),
-                max_price
-            )
-
-            # TOP 3 najtańsze zawsze w logu
-            if priced:
-                priced_sorted = sorted(
-                    ((normalize_price(o["price_pln"]), o.get("title"), o.get("url")) for o in priced),
-                    key=lambda t: t[0]
+                    logging.exception(f"Błąd pobierania z {store}: {e}")
+                    offers = []
+
+                # jeden znacznik czasu na partię ofert ze sklepu (DB + CSV)
+                now_iso = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+                # cena znormalizowana raz na ofertę (używana w DB, statystykach, CSV i powiadomieniach)
+                for o in offers:
+                    o["_price"] = normalize_price(o.get("price_pln"))
+
+                # PODGLĄD: pierwsze 5 surowych wyników z adaptera
+                if offers:
+                    logging.info("Podgląd pierwszych wyników (%s):", min(5, len(offers)))
+                    for i, o in enumerate(offers[:5], start=1):
+                        logging.info("  [%d] %s — raw_price=%r — %s",
+                                     i, o.get("title"), o.get("price_pln"), o.get("url"))
+                else:
+                    logging.info("Brak wyników z adaptera %s dla zapytania: %r", store, name)
+
+                # oferty z ceną materializowane raz jako (cena, oferta) – DB, statystyki, TOP, CSV, powiadomienia
+                priced = [(o["_price"], o) for o in offers if o["_price"] is not None]
+                good = [o for prc, o in priced if prc <= max_price]
+
+                # zapis do DB (tylko po zparsowaniu liczby) – jeden executemany i commit na sklep
+                rows = [(o.get("store"), o.get("title"), o.get("url"), prc, now_iso) for prc, o in priced]
+                # `with con` = transakcja: commit przy sukcesie, rollback całej partii przy błędzie
+                try:
+                    with con:
+                        con.executemany(
+                            "INSERT OR IGNORE INTO offers(store,title,url,price_pln,found_at) VALUES (?,?,?,?,?)",
+                            rows
+                        )
+                except sqlite3.Error as e:
+                    logging.warning(f"Zapis ofert z {store} do bazy nie powiódł się: {e}")
+
+                # STATYSTYKI
+                logging.info(
+                    "Statystyki: %d wyników ogółem, %d z ceną, %d ≤ %.2f PLN",
+                    len(offers), len(priced), len(good), max_price
                 )
-                top = priced_sorted[:3]
-                logging.info("TOP najtańsze oferty z ceną:")
-                for i, (prc, title, url) in enumerate(top, start=1):
-                    logging.info("  #%d  %.2f PLN — %s — %s", i, prc, title, url)
-
-            # dopisz rekordy z ceną do CSV (łatwe pobranie jako artefakt)
-            if priced:
-                with open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
-                    w = csv.writer(f)
-                    for o in priced:
-                        w.writerow([
-                            name,
-                            o.get("store"),
-                            o.get("title"),
-                            normalize_price(o.get("price_pln")),
-                            o.get("url"),
-                            datetime.now(timezone.utc).isoformat()
-                        ])
-
-            # notyfikacje (opcjonalne; możesz włączyć w configu)
-            good = [
-                o for o in priced
-                if normalize_price(o.get("price_pln")) <= max_price
-            ]
-            if good:
-                lines = [f"✅ {g['store']}: {g['title']} — {g['price_pln']} PLN\n{g['url']}" for g in good]
-                message = f"Znaleziono ofertę ≤ {max_price} PLN dla: {name}\n\n" + "\n\n".join(lines)
-                logging.info(message)
-                # powiadomienia są wyłączone w Twoim configu; zostawiamy tylko log
-
-            time.sleep(delay)
+
+                # TOP 3 najtańsze zawsze w logu (nsmallest zamiast pełnego sortowania)
+                if priced:
+                    top = heapq.nsmallest(3, priced, key=lambda t: t[0])
+                    logging.info("TOP najtańsze oferty z ceną:")
+                    for i, (prc, o) in enumerate(top, start=1):
+                        logging.info("  #%d  %.2f PLN — %s — %s", i, prc, o.get("title"), o.get("url"))
+
+                # dopisz rekordy z ceną do CSV (łatwe pobranie jako artefakt)
+                if priced:
+                    csv_out.writerows([
+                        name,
+                        o.get("store"),
+                        o.get("title"),
+                        prc,
+                        o.get("url"),
+                        now_iso
+                    ] for prc, o in priced)
+                    # jeden zapis na sklep – wiersze są na dysku także przy długich przerwach schedulera
+                    csv_file.flush()
+
+                # notyfikacje (opcjonalne; możesz włączyć w configu)
+                if good:
+                    lines = [f"✅ {g['store']}: {g['title']} — {g['price_pln']} PLN\n{g['url']}" for g in good]
+                    message = f"Znaleziono ofertę ≤ {max_price} PLN dla: {name}\n\n" + "\n\n".join(lines)
+                    logging.info(message)
+                    # powiadomienia są wyłączone w Twoim configu; zostawiamy tylko log
+
+                time.sleep(delay)
 
 if __name__ == "__main__":
     ensure_db()